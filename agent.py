@@ -4,7 +4,14 @@ from dotenv import load_dotenv
 from google.adk import Agent
 from google.adk.tools import google_search
 from google.adk.tools.agent_tool import AgentTool
-from .tools import export_to_google_sheet_tool, export_to_google_doc_tool, delete_google_file_tool # Import the new tools
+from google.adk.apps import App
+from google.adk.agents.context_cache_config import ContextCacheConfig
+from .tools import export_to_google_sheet_tool, export_to_google_doc_tool, delete_google_file_tool, get_trip_cost_estimates_tool, append_itinerary_day_to_google_doc_tool, start_trip_prefetch_tool # Import the new tools
+from .records import (
+    FLIGHT_RECORDS_KEY, HOTEL_RECORDS_KEY, ITINERARY_RECORDS_KEY, ITINERARY_DAY_RECORD_KEY, FOOD_RECORDS_KEY,
+    FlightRecommendations, HotelRecommendations, ItineraryRecommendations, ItineraryDayPlan, FoodRecommendations,
+)
+from .callbacks import store_streamed_itinerary_day, discard_streamed_itinerary_days, record_cache_usage, make_model_router, start_model_timer, record_model_latency, make_prefetch_consumer
 load_dotenv()
 
 
@@ -12,26 +19,42 @@ PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT")
 LOCATION = os.getenv("GOOGLE_CLOUD_LOCATION")
 AGENT_NAME = os.getenv("AGENT_NAME")
 MODEL_ID = os.getenv("MODEL_ID")
+# Per-agent model overrides, each falling back to MODEL_ID
+ROOT_MODEL_ID = os.getenv("ROOT_MODEL_ID") or MODEL_ID
+FLIGHT_MODEL_ID = os.getenv("FLIGHT_MODEL_ID") or MODEL_ID
+HOTEL_MODEL_ID = os.getenv("HOTEL_MODEL_ID") or MODEL_ID
+ITINERARY_MODEL_ID = os.getenv("ITINERARY_MODEL_ID") or MODEL_ID
+FOOD_MODEL_ID = os.getenv("FOOD_MODEL_ID") or MODEL_ID
+FINANCE_MODEL_ID = os.getenv("FINANCE_MODEL_ID") or MODEL_ID
+# Optional small model the root agent routes lightweight turns (greetings, confirmations, export acknowledgements) to
+FAST_MODEL_ID = os.getenv("FAST_MODEL_ID")
+# Context caching of the static instructions and tool schemas (set CONTEXT_CACHE_ENABLED="False" to turn off)
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "True").lower() == "true"
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "1024"))
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "1800"))
+CONTEXT_CACHE_INTERVALS = int(os.getenv("CONTEXT_CACHE_INTERVALS", "10"))
 
 flight_recommender = LlmAgent(
     name="flight_recommender",
     tools=[google_search],
-    model=MODEL_ID,
+    model=FLIGHT_MODEL_ID,
+    before_model_callback=start_model_timer,
+    after_model_callback=[record_cache_usage, record_model_latency],
     description="Looks up flight information from one destionation to another",
-    instruction=f"""You are a specialized flight recommendation assistant.
+    output_schema=FlightRecommendations,
+    output_key=FLIGHT_RECORDS_KEY,
+    instruction="""You are a specialized flight recommendation assistant.
 Your primary goal is to find and present flight options based on the user's request.
-When generating text output (e.g., for the `flight_data` parameter of an export tool), use markdown for formatting:
-- Wrap text in `**double asterisks**` for **bold**.
-- Wrap text in `*single asterisks*` or `_underscores_` for *italics*.
-- Start lines with `* ` or `- ` for bullet points.
+Your output is a structured record, not free text: fill one entry in `flights` per option found.
+Put prices in `price` as plain numbers (e.g. 250, not "$250") with the currency code in `currency`.
 
 Here's your process:
 1.  Understand the user's request for flights. This includes the origin, destination, and any specified dates or preferences (e.g., direct flights, preferred airlines, time of day).
 2.  Use available tools or , general web search if no specific flight tool is provided) to find relevant flight information.
-3.  Compile the gathered flight details. When formatting this information as a text string, use clear labels and apply markdown for emphasis (bold, italics) and lists (bullets) as appropriate. For example: `**Airline:** MyAir\n* Route: LAX to JFK\n* Price: **$250**`.
-4.  If multiple options are found, present them clearly using markdown for structure.
-5.  If no flights are found matching the exact criteria, inform the user and perhaps suggest alternative dates or nearby airports if appropriate.
-6.  If the user's request is unclear (e.g., missing origin or destination), ask for clarification.
+3.  Compile the gathered flight details into the `flights` list. For example: `{"airline": "MyAir", "origin": "LAX", "destination": "JFK", "stops": 0, "price": 250, "currency": "USD"}`.
+4.  If multiple options are found, add one entry per option.
+5.  If no flights are found matching the exact criteria, leave `flights` empty and use `notes` to inform the user and perhaps suggest alternative dates or nearby airports if appropriate.
+6.  If the user's request is unclear (e.g., missing origin or destination), leave `flights` empty and ask for clarification in `notes`.
 Do not invent flight information. All flight details must come from the search results of your tools.
 """,
   
@@ -41,22 +64,24 @@ Do not invent flight information. All flight details must come from the search r
 hotel_recommender = LlmAgent(
     name="hotel_recommender",
     tools=[google_search],
-    model=MODEL_ID,
+    model=HOTEL_MODEL_ID,
+    before_model_callback=[make_prefetch_consumer("hotels"), start_model_timer],
+    after_model_callback=[record_cache_usage, record_model_latency],
     description="Looks up hotels in a particular location",
-    instruction=f"""You are a specialized hotel recommendation assistant.
+    output_schema=HotelRecommendations,
+    output_key=HOTEL_RECORDS_KEY,
+    instruction="""You are a specialized hotel recommendation assistant.
 Your primary goal is to find and present hotel options based on the user's request.
-When generating text output (e.g., for the `hotel_data` parameter of an export tool), use markdown for formatting:
-- Wrap text in `**double asterisks**` for **bold**.
-- Wrap text in `*single asterisks*` or `_underscores_` for *italics*.
-- Start lines with `* ` or `- ` for bullet points.
+Your output is a structured record, not free text: fill one entry in `hotels` per option found.
+Put prices in `price_per_night` and `total_price` (whole stay) as plain numbers with the currency code in `currency`.
 
 Here's your process:
 1.  Understand the user's request for hotels. This includes the desired location (city, area), check-in/check-out dates, number of guests, and any preferences (e.g., budget, star rating, amenities like a pool or gym).
 2.  Use available tools (e.g., a hotel search tool, general web search if no specific hotel tool is provided) to find relevant hotel information.
-3.  Compile the gathered hotel details. When formatting this information as a text string, use clear labels and apply markdown for emphasis (bold, italics) and lists (bullets) as appropriate. For example: `**Hotel Name:** Grand Hotel\n* Rating: _5 stars_\n* Amenities:\n  * Pool\n  * Gym`.
-4.  If multiple options are found, present them clearly using markdown for structure.
-5.  If no hotels are found matching the exact criteria, inform the user and perhaps suggest alternative dates, nearby locations, or broadening their search criteria.
-6.  If the user's request is unclear (e.g., missing location or dates), ask for clarification.
+3.  Compile the gathered hotel details into the `hotels` list. For example: `{"name": "Grand Hotel", "rating": "5 stars", "price_per_night": 180, "total_price": 540, "currency": "USD", "amenities": ["Pool", "Gym"]}`.
+4.  If multiple options are found, add one entry per option.
+5.  If no hotels are found matching the exact criteria, leave `hotels` empty and use `notes` to inform the user and perhaps suggest alternative dates, nearby locations, or broadening their search criteria.
+6.  If the user's request is unclear (e.g., missing location or dates), leave `hotels` empty and ask for clarification in `notes`.
 Do not invent hotel information. All hotel details must come from the search results of your tools.
 """,
   
@@ -65,44 +90,70 @@ Do not invent hotel information. All hotel details must come from the search res
 itinerary_recommender = LlmAgent(
     name="itinerary_recommender",
     tools=[google_search],
-    model=MODEL_ID,
+    model=ITINERARY_MODEL_ID,
+    before_model_callback=[make_prefetch_consumer("itinerary"), start_model_timer],
+    after_model_callback=[record_cache_usage, record_model_latency],
     description="Creates a travel itinerary based on user preferences like location, duration, interests, and budget.",
-    instruction=f"""You are a specialized travel itinerary creation service.
-Your SOLE task is to generate and output a detailed travel itinerary as a text string, using markdown for formatting, based on the user's request.
-When generating the itinerary text (e.g., for the `itinerary_data` parameter of an export tool), use markdown:
-- Wrap text in `**double asterisks**` for **bold** (e.g., for day numbers or key activity names).
-- Wrap text in `*single asterisks*` or `_underscores_` for *italics* (e.g., for notes or times).
-- Start lines with `* ` or `- ` for bullet points (e.g., for listing activities within a day).
+    output_schema=ItineraryRecommendations,
+    output_key=ITINERARY_RECORDS_KEY,
+    after_agent_callback=discard_streamed_itinerary_days,
+    instruction="""You are a specialized travel itinerary creation service.
+Your SOLE task is to generate and output a detailed travel itinerary as a structured record based on the user's request: one entry in `days` per day, each with its `activities`.
 DO NOT confirm your ability to create an itinerary. DO NOT ask if the user wants an itinerary.
-If the user provides details for a trip (destination, duration, interests), your ONLY response should be the structured itinerary as a markdown-formatted text string.
+If the user provides details for a trip (destination, duration, interests), your ONLY response should be the structured itinerary.
 
 Here's your process for generating the itinerary content:
 1.  Understand the user's request for an itinerary. This includes the destination(s), travel dates (or duration), number of travelers, interests (e.g., adventure, relaxation, culture, history, food), budget considerations, and any specific activities or places they want to include.
 2.  Use available tools (e.g., general web search, specific attraction finders if available) to gather information about attractions, activities, estimated travel times between locations, and potential opening hours or booking requirements.
-3.  Structure the itinerary logically, usually day by day. For each day, suggest a sequence of activities using markdown bullet points. Emphasize key details using bold or italics. For example: `**Day 1:**\n* _Morning:_ Visit the **Eiffel Tower**\n* _Afternoon:_ Explore the *Louvre Museum*`.
-4.  Include practical details where possible, formatted with markdown.
+3.  Structure the itinerary day by day. For each day, list a sequence of activities. For example: `{"day": 1, "title": "Classic Paris", "activities": [{"time_of_day": "Morning", "name": "Eiffel Tower", "estimated_cost": 60, "currency": "EUR"}, {"time_of_day": "Afternoon", "name": "Louvre Museum"}]}`.
+4.  Include practical details in each activity's `notes`, and an `estimated_cost` as a plain number with its `currency` code where entry fees or tickets are known.
 5.  Offer a balance of activities based on the user's interests. Consider pacing – avoid making the itinerary too rushed or too empty.
-6.  If the user's request is unclear or lacks key information (e.g., destination, duration, interests) to generate a meaningful itinerary, you may ask for specific clarifications before attempting to generate the markdown output.
-7.  Your output MUST be the itinerary itself, presented as a clear, markdown-formatted text string.
+6.  If the user's request is unclear or lacks key information (e.g., destination, duration, interests) to generate a meaningful itinerary, leave `days` empty and ask for specific clarifications in `notes`.
+7.  Your output MUST be the itinerary itself.
 Do not invent attractions or details that cannot be reasonably verified. Base all suggestions on information found through your tools.
 """,
   
     )
 
+itinerary_day_recommender = LlmAgent(
+    name="itinerary_day_recommender",
+    tools=[google_search],
+    model=ITINERARY_MODEL_ID,
+    before_model_callback=[make_prefetch_consumer("itinerary"), start_model_timer],
+    after_model_callback=[record_cache_usage, record_model_latency],
+    description="Creates ONE day of a travel itinerary at a time, for showing and exporting a long itinerary day by day.",
+    output_schema=ItineraryDayPlan,
+    output_key=ITINERARY_DAY_RECORD_KEY,
+    after_agent_callback=store_streamed_itinerary_day,
+    instruction="""You are a specialized travel itinerary creation service that plans exactly ONE day of a trip per request.
+Your SOLE task is to output the requested day as a structured record: the `day` number, optionally its `date` and a short `title`, and its `activities`.
+DO NOT confirm your ability to create an itinerary. DO NOT ask questions. DO NOT plan any other day.
+
+Here's your process:
+1.  Read the request: the destination, the day number to plan (and the total number of days), travel dates, number of travelers, interests, budget, and the activities already planned for earlier days.
+2.  Use your search tool to gather information about attractions, activities, travel times, opening hours and booking requirements for that day.
+3.  Suggest a balanced sequence of activities for the day. For example: `{"day": 2, "title": "Art and Gardens", "activities": [{"time_of_day": "Morning", "name": "Musee d'Orsay", "estimated_cost": 32, "currency": "EUR"}, {"time_of_day": "Afternoon", "name": "Luxembourg Gardens"}]}`.
+4.  Include practical details in each activity's `notes`, and an `estimated_cost` as a plain number with its `currency` code where entry fees or tickets are known.
+5.  Do not repeat activities already planned for earlier days.
+Do not invent attractions or details that cannot be reasonably verified. Base all suggestions on information found through your tools.
+""",
+    )
+
 food_recommender = LlmAgent(
     name="food_recommender",
     tools=[google_search],
-    model=MODEL_ID,
+    model=FOOD_MODEL_ID,
+    before_model_callback=[make_prefetch_consumer("food"), start_model_timer],
+    after_model_callback=[record_cache_usage, record_model_latency],
     description="Recommends restaurants, cafes, and food trucks based on user's cuisine preferences and travel itinerary.",
+    output_schema=FoodRecommendations,
+    output_key=FOOD_RECORDS_KEY,
     instruction="""You are a specialized food recommendation assistant for travelers.
 Your primary goal is to suggest dining options (restaurants, cafes, food trucks) based on the user's cuisine preferences and their travel itinerary.
-When generating text output, use markdown for formatting:
-- Wrap text in `**double asterisks**` for **bold**.
-- Wrap text in `*single asterisks*` or `_underscores_` for *italics*.
-- Start lines with `* ` or `- ` for bullet points.
+Your output is a structured record, not free text: fill one entry in `venues` per recommended place.
 
 Here's your process:
-1.  Ask the user about their cuisine preferences (e.g., Italian, Mexican, vegetarian, specific dishes they enjoy).
+1.  If the user's cuisine preferences are not provided, ask for them in `notes` (e.g., Italian, Mexican, vegetarian, specific dishes they enjoy).
 2.  You will be provided with information about the user's travel itinerary, specifically the locations they will be visiting and potentially the timing (e.g., "Day 1: Eiffel Tower area in the morning, Louvre Museum in the afternoon").
 3.  Based on the cuisine preferences and the locations from the itinerary, use your search tool to find nearby restaurants, cafes, or food trucks.
 4.  For each recommended place, try to provide:
@@ -110,11 +161,11 @@ Here's your process:
     *   Type of cuisine.
     *   A brief description or why it's recommended (e.g., popular, good reviews, unique offerings).
     *   Optionally, its general location relative to an itinerary point (e.g., "near the Eiffel Tower").
-    *   Use markdown for clear presentation. For example:
-        `**Restaurant Name:** Le Petit Bistro\n* Cuisine: French\n* Notes: _Classic Parisian cafe, great for lunch near the Louvre._`
+    *   Optionally, the itinerary `day` it fits and an `estimated_cost` of a meal as a plain number with its `currency` code.
+    For example: `{"name": "Le Petit Bistro", "cuisine": "French", "location": "near the Louvre", "day": 1, "notes": "Classic Parisian cafe, great for lunch.", "estimated_cost": 45, "currency": "EUR"}`
 5.  If multiple options are found for a particular area or preference, present a few choices.
-6.  If the user's request is unclear or if you need more specific itinerary details to make relevant recommendations (e.g., "Which part of Day 1 are you looking for food options for?"), ask for clarification.
-7.  If no suitable options are found for a specific request, inform the user and perhaps ask if they'd like to try a different cuisine type or a slightly broader search area.
+6.  If the user's request is unclear or if you need more specific itinerary details to make relevant recommendations (e.g., "Which part of Day 1 are you looking for food options for?"), leave `venues` empty and ask for clarification in `notes`.
+7.  If no suitable options are found for a specific request, leave `venues` empty and use `notes` to inform the user and perhaps ask if they'd like to try a different cuisine type or a slightly broader search area.
 Do not invent restaurant information. All recommendations must come from the search results of your tools.
 Focus solely on food recommendations. Do not handle flight, hotel, or full itinerary planning.
 """
@@ -122,15 +173,18 @@ Focus solely on food recommendations. Do not handle flight, hotel, or full itine
 
 financial_planner_agent = LlmAgent(
     name="financial_planner_agent",
-    tools=[export_to_google_sheet_tool],
-    model=MODEL_ID,
+    tools=[get_trip_cost_estimates_tool, export_to_google_sheet_tool],
+    model=FINANCE_MODEL_ID,
+    before_model_callback=start_model_timer,
+    after_model_callback=[record_cache_usage, record_model_latency],
     description="Helps create a financial plan for a trip, estimating costs, comparing against a budget, providing a summary, and exporting the plan to Google Sheets.",
     instruction="""You are a financial planning assistant for trips.
 Your goal is to help the user estimate trip costs and see how they fit within a budget.
 
 Here's your process:
 1.  Ask the user for their travel Source and Destination if not already provided. Ensure you capture these as `Source` and `Destination`.
-2.  Ask the user for their estimated costs for:
+2.  Call the `get_trip_cost_estimates_tool` first. It returns the costs already found by the flight, hotel, itinerary and food recommenders in this session.
+    Each estimate has an `amount` and a `currency`; for Food, its `reason` says what the amount covers (e.g. one meal per day), so mention that to the user. Present the estimates it returns to the user in one message, with their currencies, and ask them to confirm or correct them. If an estimate's currency differs from the currency of the user's budget, ask the user for the converted amount instead of using it as is. Only ask the user for the categories listed in `missing_categories` (the `reason` says why each is missing), among:
     *   Flights
     *   Hotels
     *   Itinerary (activities, local transport)
@@ -138,10 +192,10 @@ Here's your process:
     If the user needs help estimating these costs, suggest they use the main travel planner's search capabilities or provide their best estimates.
 3.  Ask the user for their total `Budget_amount` for the trip.
 4.  From the user's responses in steps 2 and 3, you MUST capture the following numeric values:
-    a.  `Flights_cost`: The numeric cost for flights provided by the user.
-    b.  `Hotels_cost`: The numeric cost for hotels provided by the user.
-    c.  `Itinerary_cost`: The numeric cost for itinerary/activities provided by the user.
-    d.  `Food_cost`: The numeric cost for food provided by the user.
+    a.  `Flights_cost`: The numeric cost for flights (confirmed estimate or provided by the user).
+    b.  `Hotels_cost`: The numeric cost for hotels (confirmed estimate or provided by the user).
+    c.  `Itinerary_cost`: The numeric cost for itinerary/activities (confirmed estimate or provided by the user).
+    d.  `Food_cost`: The numeric cost for food (confirmed estimate or provided by the user).
     e.  `Budget_amount`: The total numeric budget for the trip provided by the user.
     Remember to also use the `Source` and `Destination` collected in step 1.
     IMPORTANT: Convert any textual costs from the user (e.g., "around $500", "a thousand dollars") into actual numbers (e.g., 500, 1000). If the user does not provide a specific numeric estimate for a cost item after you've asked, you should use 0 for that item in calculations and clearly state this. These captured numeric values (`Flights_cost`, `Hotels_cost`, `Itinerary_cost`, `Food_cost`, `Budget_amount`) are what you will use in the next steps for calculations and export.
@@ -187,7 +241,9 @@ If the user provides costs as text (e.g., "around $500"), convert it to a number
 
 root_agent = LlmAgent(
     name="travel_planner",
-    model=MODEL_ID,
+    model=ROOT_MODEL_ID,
+    before_model_callback=make_model_router(FAST_MODEL_ID),
+    after_model_callback=[record_cache_usage, record_model_latency],
     description="You are a friendly travel agent that helps users plan their trips. You can help with flight recommendations, hotel bookings, creating personalized itineraries, and financial planning for the trip. Trip details can be exported to Google Docs, and financial plans to Google Sheets.",
     instruction="""You are a friendly and helpful travel agent.
 Your goal is to assist users in planning their perfect trip.
@@ -199,42 +255,46 @@ You can help with:
 - Recommending food options (restaurants, cafes, food trucks) based on preferences and itinerary.
 - Creating a financial plan for the trip (estimating costs, comparing against a budget, and getting a spending summary)
 Be prepared to guide them through the process. To fulfill their requests, use your available tools:
+- As soon as the destination and travel dates are known, call the `start_trip_prefetch_tool` tool once with the `destination`, `start_date` and `end_date` (you can call it together with `flight_recommender`). It starts the hotel, activity and restaurant searches in the background so the later recommenders answer faster. Call it again if the destination or dates change. Do not tell the user about it.
 - For flight recommendations, use the `flight_recommender` tool.
 - For hotel searches, use the `hotel_recommender` tool.
-- For creating personalized travel itineraries, use the `itinerary_recommender` tool.
+- For creating personalized travel itineraries, use the `itinerary_recommender` tool. For long trips, or when the user wants to see the itinerary as it is being built, use the `itinerary_day_recommender` tool instead, once per day (see "Streaming Itinerary" below).
 - For financial planning (collecting source/destination, estimating costs, getting a spending summary, and comparing against a budget), use the `financial_planner_agent` tool. This agent will provide a summary and can then export the detailed financial plan (including source and destination) to Google Sheets.
-- For food recommendations, use the `food_recommender` tool. You should provide this agent with relevant parts of the itinerary (like locations for specific days/times) and ask it to find food options based on user preferences. Store the output as `food_data`.
-- To export the descriptive trip plan (textual flight details, hotel descriptions, itinerary) to a Google Doc, use the `export_to_google_doc_tool` tool. You can suggest a title for the document.
+- For food recommendations, use the `food_recommender` tool. You should provide this agent with relevant parts of the itinerary (like locations for specific days/times) and ask it to find food options based on user preferences.
+- The recommender tools return structured records (and keep them for the rest of the session). Present them to the user in a readable form; if a record only contains `notes` (e.g. a clarification question), relay those notes to the user.
+- To export the descriptive trip plan (flight details, hotel descriptions, itinerary, food) to a Google Doc, use the `export_to_google_doc_tool` tool. It reads the stored recommendations itself, so you only pass an optional title for the document.
 - To delete a Google Sheet or Google Doc previously created by this agent (or any file the service account has permission to delete), use the `delete_google_file_tool` tool. You will need the File ID (which is the Spreadsheet ID for sheets, or Document ID for docs). This action is permanent.
 
 Workflow for Trip Planning and Exporting:
 1.  Gathering Trip Information:
-    a.  First, use the `flight_recommender` tool to get flight options. Store this as `flight_data`.
-    b.  Next, use the `hotel_recommender` tool to find hotel options. Store this as `hotel_data`.
-    c.  Then, use the `itinerary_recommender` tool to generate a detailed itinerary. Store this as `itinerary_data`.
-    d.  Initialize `food_data` as None or an empty string.
+    a.  First, use the `flight_recommender` tool to get flight options.
+    b.  Next, use the `hotel_recommender` tool to find hotel options.
+    c.  Then, use the `itinerary_recommender` tool to generate a detailed itinerary. For trips longer than 3 days, or if the user asks to see it as it is built, follow "Streaming Itinerary" instead.
 
 2.  Food Recommendations (Optional, can happen before or after financial planning):
     a.  Ask the user if they'd like food recommendations.
     b.  If yes, use the `food_recommender` tool. You will need to:
         i.  Ask the user for their cuisine preferences.
         ii. Pass the relevant itinerary information (e.g., "On Day 1, they will be near the Eiffel Tower around lunchtime") and cuisine preferences to the `food_recommender`.
-        iii. Store the output from `food_recommender` into the `food_data` variable.
 
 3.  Financial Planning:
     a.  Ask the user if they would like assistance with financial planning for their trip.
-    b.  If yes, use the `financial_planner_agent` tool. This agent will guide the user through providing source/destination (if not already known), estimating costs, and budget. It will then provide an AI-generated summary and is responsible for exporting the detailed financial plan (including source and destination) to Google Sheets using its `export_to_google_sheet_tool`. The sheet will be titled "Finance Planner" by default (or a user-specified title) and will contain a "Finance Planner" tab with the financial breakdown.
+    b.  If yes, use the `financial_planner_agent` tool. This agent will pre-fill costs from the flight, hotel, itinerary and food recommendations already gathered, and guide the user through providing source/destination (if not already known), any missing costs, and budget. It will then provide an AI-generated summary and is responsible for exporting the detailed financial plan (including source and destination) to Google Sheets using its `export_to_google_sheet_tool`. The sheet will be titled "Finance Planner" by default (or a user-specified title) and will contain a "Finance Planner" tab with the financial breakdown.
 4.  Exporting Descriptive Trip Plan to Google Docs:
-    a.  After gathering `flight_data`, `hotel_data`, `itinerary_data`, and optionally `food_data`, ask the user if they would like to export this trip plan to Google Docs.
+    a.  After gathering flights, hotels, the itinerary, and optionally food recommendations, ask the user if they would like to export this trip plan to Google Docs.
     b.  If they confirm:
         i.  You can optionally ask the user for a desired title for the new document (e.g., "Paris Trip Details"). If no title is provided, the tool can use a default.
-        ii. Use the `export_to_google_doc_tool` tool, providing:
-            - `flight_data`
-            - `hotel_data`
-            - `itinerary_data`
-            - `food_recommendations_data` (this will be the `food_data` you stored)
-            - and optionally a `document_title`.
- 
+        ii. Use the `export_to_google_doc_tool` tool, optionally providing a `document_title`. The flight, hotel, itinerary and food records are read from the session, so do not pass them.
+
+5.  Streaming Itinerary (day by day):
+    a.  Optionally ask the user if they want the itinerary added to a Google Doc as it is generated. If yes, and no Doc exists yet, first create it with `export_to_google_doc_tool` passing `include_itinerary=False` (flights, hotels and any food recommendations are written, and the Itinerary section starts empty) and keep the returned `document_id`.
+    b.  For each day from 1 to the last day of the trip, in order:
+        i.  Call the `itinerary_day_recommender` tool with the destination, the day number and total number of days, dates, travelers, interests, budget, and the names of the activities already planned for earlier days.
+        ii. Immediately show that day to the user in your reply, before requesting the next day.
+        iii.If the user wanted a Google Doc, call the `append_itinerary_day_to_google_doc_tool` tool with the `document_id` and the `day` number.
+    c.  Each streamed day is also kept as part of the full itinerary, so later exports and financial planning include it. Regenerating a day replaces only that day. Do not call `itinerary_recommender` for the same trip afterwards; its itinerary would replace all streamed days.
+    d.  Days are added at the end of the Doc's Itinerary section. Food recommendations gathered afterwards are not added to that Doc; export a new Doc with `export_to_google_doc_tool` to include them.
+
 6.  Deleting Files:
     a.  If the user wants to delete a file:
         i.  Ask for the File ID (Spreadsheet ID or Document ID) of the file they want to delete.
@@ -249,11 +309,32 @@ Inform the user about the outcome of each step. If an export is successful, prov
         AgentTool(agent=hotel_recommender),
         AgentTool(agent=flight_recommender),
         AgentTool(agent=itinerary_recommender),
+        AgentTool(agent=itinerary_day_recommender),
         AgentTool(agent=financial_planner_agent), # Added financial planner
         AgentTool(agent=food_recommender),
         export_to_google_doc_tool,
+        append_itinerary_day_to_google_doc_tool,
         delete_google_file_tool,
-        export_to_google_sheet_tool
+        export_to_google_sheet_tool,
+        start_trip_prefetch_tool
     ]
 
-)
\ No newline at end of file
+)
+
+# Wrapping the agent tree in an App lets ADK cache root_agent's large static instruction and tool
+# schemas across turns. The cache is keyed on a fingerprint of that content, so editing an instruction
+# creates a fresh cache instead of reusing a stale one.
+# Only root_agent is explicitly cached: AgentTool runs each sub-agent (including financial_planner_agent)
+# in a new Runner and session without this config, so no cache metadata carries over between calls.
+# Sub-agents rely on Gemini's implicit prefix caching of their static instructions instead, and
+# record_cache_usage reports whatever cached tokens they get.
+# `adk web`/`adk api_server` create sessions under the agent directory's name, so the App must use it too
+app = App(
+    name=os.path.basename(os.path.dirname(os.path.abspath(__file__))),
+    root_agent=root_agent,
+    context_cache_config=ContextCacheConfig(
+        min_tokens=CONTEXT_CACHE_MIN_TOKENS,
+        ttl_seconds=CONTEXT_CACHE_TTL_SECONDS,
+        cache_intervals=CONTEXT_CACHE_INTERVALS,
+    ) if CONTEXT_CACHE_ENABLED else None,
+)
@@ -0,0 +1,240 @@
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+from .prefetch import PREFETCH_TRIP_KEY, PREFETCH_WAIT_SECONDS, prefetch_cache
+from .records import ITINERARY_DAY_RECORD_KEY, ItineraryDayPlan, clear_streamed_itinerary_days, itinerary_day_key
+
+# Per-agent prompt token counters, kept for the lifetime of the process
+_CACHE_USAGE: Dict[str, Dict[str, int]] = {}
+# Per-tier model latency and routing counters, kept for the lifetime of the process
+_TIER_LATENCY: Dict[str, Dict[str, Any]] = {}
+_ROUTING_DECISIONS: Dict[str, int] = {}
+_FAILED_MODEL_CALLS: Dict[str, int] = {}
+# In-flight model calls: invocation_id -> (tier, model, start time). Calls within one invocation are sequential.
+_PENDING_MODEL_CALLS: Dict[str, Tuple[str, str, float]] = {}
+# A pending call older than this never reached record_model_latency (it errored or was short-circuited)
+_PENDING_CALL_TIMEOUT_SECONDS = 600.0
+
+FAST_TIER = "fast"
+STANDARD_TIER = "standard"
+
+# User turns made up only of greetings, thanks and confirmations (plus punctuation), e.g. "Yes, please!".
+# A bare "no" is left out on purpose: it usually comes with or precedes a correction that needs planning.
+_LIGHTWEIGHT_PHRASE = r"(hi|hello|hey|thanks|thank you|no thanks|no thank you|ok|okay|yes|yep|yeah|sure|great|perfect|sounds good|go ahead|please do|please|bye|goodbye)"
+_LIGHTWEIGHT_TURN_PATTERN = re.compile(
+    rf"^[\s!.,]*{_LIGHTWEIGHT_PHRASE}([\s!.,]+{_LIGHTWEIGHT_PHRASE})*[\s!.,]*$",
+    re.IGNORECASE
+)
+# Tool results that the root agent only has to acknowledge (export/delete outcomes). Appending a
+# streamed day is left out: the root agent goes on to generate the next day after it.
+_LIGHTWEIGHT_TOOL_RESULTS = {
+    "export_trip_plan_to_google_doc",
+    "export_trip_plan_to_google_sheet",
+    "delete_google_file_by_id",
+}
+
+
+def store_streamed_itinerary_day(callback_context: CallbackContext) -> Optional[types.Content]:
+    """
+    after_agent_callback for the streaming itinerary agent.
+    Moves the day it just produced to a state key of its own (records.itinerary_day_key), so exports
+    and cost estimates see the streamed days like an itinerary generated in one go, and day calls
+    running in parallel each forward only their own day back to the root session.
+    The day record is cleared afterwards, so a later call that ends without output cannot store a stale day.
+    """
+    day = callback_context.state.get(ITINERARY_DAY_RECORD_KEY)
+    if not day:
+        return None
+    try:
+        plan = ItineraryDayPlan.model_validate(day)
+        callback_context.state[itinerary_day_key(plan.day)] = plan.model_dump(exclude_none=True)
+    except Exception as e:
+        print(f"WARNING: Could not store streamed itinerary day from '{ITINERARY_DAY_RECORD_KEY}': {e}")
+    callback_context.state[ITINERARY_DAY_RECORD_KEY] = None
+    return None # Keep the agent's own output
+
+
+def discard_streamed_itinerary_days(callback_context: CallbackContext) -> Optional[types.Content]:
+    """after_agent_callback for the full itinerary agent: its new itinerary replaces any days streamed before."""
+    clear_streamed_itinerary_days(callback_context.state)
+    return None # Keep the agent's own output
+
+
+def record_cache_usage(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+    """
+    after_model_callback that records how many prompt tokens were served from the context cache.
+    For root_agent that is the App's ContextCacheConfig (see agent.py); for the sub-agents, which
+    AgentTool runs outside the App, it is only Gemini's implicit caching.
+    """
+    usage = llm_response.usage_metadata
+    if llm_response.partial or not usage:
+        return None
+    prompt_tokens = usage.prompt_token_count or 0
+    cached_tokens = usage.cached_content_token_count or 0
+
+    stats = _CACHE_USAGE.setdefault(callback_context.agent_name, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0})
+    stats["calls"] += 1
+    stats["prompt_tokens"] += prompt_tokens
+    stats["cached_tokens"] += cached_tokens
+
+    hit_ratio = cached_tokens / prompt_tokens if prompt_tokens else 0.0
+    total_ratio = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+    print(f"INFO: {callback_context.agent_name} - {cached_tokens}/{prompt_tokens} prompt tokens from cache ({hit_ratio:.0%}); "
+          f"{stats['cached_tokens']}/{stats['prompt_tokens']} over {stats['calls']} calls ({total_ratio:.0%}).")
+    return None # Keep the model's response
+
+
+def get_cache_usage() -> Dict[str, Dict[str, int]]:
+    """Returns a copy of the per-agent cached-token counters recorded so far."""
+    return {agent_name: dict(stats) for agent_name, stats in _CACHE_USAGE.items()}
+
+
+def _starts_workflow_step(llm_request: LlmRequest, function_response: types.FunctionResponse) -> bool:
+    """
+    True if the tool call behind `function_response` is followed by more planning work. Exporting the doc
+    with include_itinerary=False starts the day-by-day itinerary loop, so that result is not just acknowledged.
+    """
+    if function_response.name != "export_trip_plan_to_google_doc":
+        return False
+    for content in reversed(llm_request.contents[:-1]):
+        for part in content.parts or []:
+            call = part.function_call
+            if call and call.name == function_response.name and (not function_response.id or call.id == function_response.id):
+                return (call.args or {}).get("include_itinerary") is False
+    return False
+
+
+def _is_lightweight_turn(llm_request: LlmRequest) -> Tuple[bool, str]:
+    """Decides from the latest content whether the next model call is a lightweight turn. Returns (is_lightweight, reason)."""
+    if not llm_request.contents:
+        return False, "no contents"
+    parts = llm_request.contents[-1].parts or []
+
+    function_responses = [p.function_response for p in parts if p.function_response]
+    if function_responses:
+        names = {fr.name for fr in function_responses}
+        if names <= _LIGHTWEIGHT_TOOL_RESULTS and not any(_starts_workflow_step(llm_request, fr) for fr in function_responses):
+            return True, f"acknowledging {', '.join(sorted(names))}"
+        return False, f"presenting {', '.join(sorted(names))}"
+
+    text = " ".join(p.text for p in parts if p.text).strip()
+    if text and _LIGHTWEIGHT_TURN_PATTERN.match(text):
+        return True, "greeting/confirmation"
+    return False, "planning turn"
+
+
+def make_model_router(fast_model: Optional[str]) -> Callable[[CallbackContext, LlmRequest], Optional[LlmResponse]]:
+    """
+    Builds a before_model_callback that sends lightweight turns (greetings, confirmations,
+    export acknowledgements) to `fast_model` and leaves every other turn on the agent's own model.
+    With no `fast_model` configured, it only records the call for latency tracking.
+    """
+    def route_model_tier(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+        tier = STANDARD_TIER
+        if fast_model:
+            is_lightweight, reason = _is_lightweight_turn(llm_request)
+            if is_lightweight:
+                tier = FAST_TIER
+                llm_request.model = fast_model
+                # The context cache was created for the agent's own model and Vertex AI rejects it for another
+                # model, so the fast call goes uncached; the standard tier keeps using its cache afterwards.
+                llm_request.cache_config = None
+                llm_request.cache_metadata = None
+            _ROUTING_DECISIONS[tier] = _ROUTING_DECISIONS.get(tier, 0) + 1
+            print(f"INFO: {callback_context.agent_name} routed to {tier} tier ({llm_request.model}): {reason}.")
+        _start_model_call(callback_context.invocation_id, tier, llm_request.model or "")
+        return None # Continue with the (possibly re-routed) model call
+
+    return route_model_tier
+
+
+def _start_model_call(invocation_id: str, tier: str, model: str) -> None:
+    """
+    Registers a model call for latency tracking. A call still pending for the same invocation, or pending
+    for longer than _PENDING_CALL_TIMEOUT_SECONDS, never finished, so it is counted as failed and dropped
+    instead of having its start time attributed to a later call.
+    """
+    now = time.perf_counter()
+    for stale_id in [
+        pending_id for pending_id, (_, _, started_at) in _PENDING_MODEL_CALLS.items()
+        if pending_id == invocation_id or now - started_at > _PENDING_CALL_TIMEOUT_SECONDS
+    ]:
+        stale_tier, stale_model, _ = _PENDING_MODEL_CALLS.pop(stale_id)
+        _FAILED_MODEL_CALLS[f"{stale_tier}:{stale_model}"] = _FAILED_MODEL_CALLS.get(f"{stale_tier}:{stale_model}", 0) + 1
+        print(f"WARNING: {stale_tier} tier ({stale_model}) model call in invocation {stale_id} did not complete; counted as failed.")
+    _PENDING_MODEL_CALLS[invocation_id] = (tier, model, now)
+
+
+def start_model_timer(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """before_model_callback for agents without routing: records the call on the standard tier for latency tracking."""
+    _start_model_call(callback_context.invocation_id, STANDARD_TIER, llm_request.model or "")
+    return None
+
+
+def record_model_latency(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+    """after_model_callback that records the latency of the finished model call under its tier and model."""
+    if llm_response.partial:
+        return None
+    pending = _PENDING_MODEL_CALLS.pop(callback_context.invocation_id, None)
+    if not pending:
+        return None
+    tier, model, started_at = pending
+    latency = time.perf_counter() - started_at
+
+    stats = _TIER_LATENCY.setdefault(f"{tier}:{model}", {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+    stats["calls"] += 1
+    stats["total_seconds"] += latency
+    stats["max_seconds"] = max(stats["max_seconds"], latency)
+    print(f"INFO: {callback_context.agent_name} - {tier} tier ({model}) call took {latency:.2f}s; "
+          f"average {stats['total_seconds'] / stats['calls']:.2f}s over {stats['calls']} calls.")
+    return None # Keep the model's response
+
+
+def get_routing_stats() -> Dict[str, Any]:
+    """Returns a copy of the routing decision counts, per-tier latency and failed calls recorded so far."""
+    return {
+        "decisions": dict(_ROUTING_DECISIONS),
+        "latency": {tier_model: dict(stats) for tier_model, stats in _TIER_LATENCY.items()},
+        "failed": dict(_FAILED_MODEL_CALLS),
+    }
+
+
+def _mentions_destination(llm_request: LlmRequest, destination: str) -> bool:
+    """True if the user content of the request names `destination` (or its first part, e.g. "Paris" for "Paris, France")."""
+    text = " ".join(
+        part.text for content in llm_request.contents if content.role == "user" for part in content.parts or [] if part.text
+    ).lower()
+    return destination.strip().lower() in text or destination.split(",")[0].strip().lower() in text
+
+
+def make_prefetch_consumer(kind: str) -> Callable[[CallbackContext, LlmRequest], Awaitable[Optional[LlmResponse]]]:
+    """
+    Builds a before_model_callback that adds the prefetched `kind` search results for the current trip
+    (see tools.start_trip_prefetch) to the request. They are appended after the conversation, so the
+    cached static instruction prefix stays unchanged. Requests that don't name the prefetched destination
+    (e.g. a quick lookup for another city) get no prefetched results.
+    """
+    async def consume_prefetched_search(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+        prefetch_scope = callback_context.state.get(PREFETCH_TRIP_KEY)
+        if not prefetch_scope:
+            return None # Nothing was prefetched in this session
+        destination = prefetch_scope.get("destination")
+        if destination and not _mentions_destination(llm_request, destination):
+            print(f"INFO: {callback_context.agent_name} request is not about {destination}; prefetched {kind} results not used.")
+            return None
+        findings = await prefetch_cache.consume(
+            prefetch_scope["session_id"], prefetch_scope["trip_key"], kind, PREFETCH_WAIT_SECONDS
+        )
+        print(f"INFO: {callback_context.agent_name} prefetch {'hit' if findings else 'miss'} for {kind}. Stats: {prefetch_cache.stats()}")
+        if findings:
+            llm_request.contents.append(types.Content(role="user", parts=[types.Part(text=(
+                "Search results already gathered in the background for this trip. Use them, and only search "
+                f"again for details they do not cover:\n{findings}"
+            ))]))
+        return None # Continue with the model call
+
+    return consume_prefetched_search
+
@@ -0,0 +1,149 @@
+import asyncio
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+from google import genai
+from google.genai import types
+
+# Session state key holding {"session_id", "trip_key", "destination"} of the background searches started for
+# the trip. The root session id is kept because AgentTool runs each sub-agent in a session of its own.
+PREFETCH_TRIP_KEY = "prefetch_trip_key"
+
+# Searches the hotel, itinerary and food recommenders almost always run once destination and dates are known
+PREFETCH_QUERIES = {
+    "hotels": "Hotels in {destination} for a stay from {start_date} to {end_date}: names, areas, star ratings, "
+              "amenities, nightly rates and total stay prices.",
+    "itinerary": "Top attractions and activities in {destination} between {start_date} and {end_date}: opening hours, "
+                 "ticket prices, booking requirements and travel times between them.",
+    "food": "Popular, well-reviewed restaurants, cafes and food trucks in {destination} near its main attractions: "
+            "cuisine, location and typical meal prices.",
+}
+
+PREFETCH_CACHE_SIZE = int(os.getenv("PREFETCH_CACHE_SIZE", "12"))
+# How long a sub-agent waits for a search that is still running before it does its own
+PREFETCH_WAIT_SECONDS = float(os.getenv("PREFETCH_WAIT_SECONDS", "20"))
+
+
+def make_trip_key(destination: str, start_date: str, end_date: str) -> str:
+    return "|".join(part.strip().lower() for part in (destination, start_date, end_date))
+
+
+@dataclass
+class _Entry:
+    task: "asyncio.Task[str]"
+    consumed: bool = False
+
+
+class PrefetchCache:
+    """
+    Bounded cache of speculative google_search lookups, keyed by (session id, trip key, kind).
+    Starting searches for a new trip drops the session's entries for its previous trip (cancelling
+    those still running); other sessions' entries are never touched by this. Beyond `max_entries`
+    the least recently used finished entry is evicted, and a running one only if none has finished.
+    Anything cancelled or dropped before a sub-agent consumed it is counted as wasted; finished
+    results that are still cached but unused are reported as "unused".
+    """
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], _Entry]" = OrderedDict()
+        self._client: Optional[genai.Client] = None
+        self._stats = {"started": 0, "completed": 0, "failed": 0, "cancelled": 0, "hits": 0, "misses": 0, "wasted": 0}
+
+    def _get_client(self) -> genai.Client:
+        if self._client is None:
+            self._client = genai.Client() # Picks up GOOGLE_GENAI_USE_VERTEXAI / project / location from the environment
+        return self._client
+
+    async def _search(self, model: str, query: str) -> str:
+        response = await self._get_client().aio.models.generate_content(
+            model=model,
+            contents=query,
+            config=types.GenerateContentConfig(tools=[types.Tool(google_search=types.GoogleSearch())]),
+        )
+        return response.text or ""
+
+    def _on_done(self, task: "asyncio.Task[str]") -> None:
+        if task.cancelled():
+            self._stats["cancelled"] += 1
+        elif task.exception():
+            self._stats["failed"] += 1
+            print(f"WARNING: Prefetch search failed: {task.exception()}")
+        else:
+            self._stats["completed"] += 1
+
+    def _drop(self, key: Tuple[str, str, str]) -> None:
+        entry = self._entries.pop(key)
+        if not entry.consumed:
+            self._stats["wasted"] += 1
+        if not entry.task.done():
+            entry.task.cancel()
+
+    def _evict_one(self) -> None:
+        finished = next((key for key, entry in self._entries.items() if entry.task.done()), None)
+        self._drop(finished if finished is not None else next(iter(self._entries)))
+
+    def start(self, session_id: str, trip_key: str, model: str, destination: str, start_date: str, end_date: str) -> int:
+        """Starts the background searches for a session's trip. Returns how many were started (0 if already running or cached)."""
+        for key in [k for k in self._entries if k[0] == session_id and k[1] != trip_key]:
+            self._drop(key) # The session's trip changed, so results for its old trip are no longer useful
+
+        started = 0
+        for kind, template in PREFETCH_QUERIES.items():
+            key = (session_id, trip_key, kind)
+            if key in self._entries:
+                continue
+            query = template.format(destination=destination, start_date=start_date, end_date=end_date)
+            task = asyncio.get_running_loop().create_task(self._search(model, query))
+            task.add_done_callback(self._on_done)
+            self._entries[key] = _Entry(task=task)
+            self._stats["started"] += 1
+            started += 1
+
+        while len(self._entries) > self._max_entries:
+            self._evict_one()
+        return started
+
+    async def consume(self, session_id: str, trip_key: str, kind: str, wait_seconds: float) -> Optional[str]:
+        """
+        Returns the prefetched findings for `kind`, waiting up to `wait_seconds` for a running search.
+        Returns None (a miss) if nothing was prefetched, the search failed or was cancelled, or it did
+        not finish in time.
+        """
+        key = (session_id, trip_key, kind)
+        entry = self._entries.get(key)
+        if entry is None or entry.task.cancelled():
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        try:
+            # shield() so a timeout here doesn't cancel a search another call may still use
+            findings = await asyncio.wait_for(asyncio.shield(entry.task), timeout=wait_seconds)
+        except asyncio.CancelledError:
+            if not entry.task.cancelled():
+                raise # The waiting caller itself was cancelled
+            self._stats["misses"] += 1 # The search was cancelled (trip changed or evicted) while we waited
+            return None
+        except Exception: # Timed out or the search failed
+            if not entry.consumed:
+                self._stats["misses"] += 1
+            return None
+        if not entry.consumed:
+            entry.consumed = True
+            self._stats["hits"] += 1
+        return findings or None
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["in_flight"] = sum(1 for entry in self._entries.values() if not entry.task.done())
+        stats["unused"] = sum(
+            1 for entry in self._entries.values()
+            if entry.task.done() and not entry.task.cancelled() and not entry.task.exception() and not entry.consumed
+        )
+        return stats
+
+
+prefetch_cache = PrefetchCache(max_entries=PREFETCH_CACHE_SIZE)
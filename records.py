@@ -0,0 +1,331 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field
+
+# Session state keys the recommender agents write their validated output to (via `output_key`)
+FLIGHT_RECORDS_KEY = "flight_records"
+HOTEL_RECORDS_KEY = "hotel_records"
+ITINERARY_RECORDS_KEY = "itinerary_records"
+FOOD_RECORDS_KEY = "food_records"
+# Latest single day produced by the streaming itinerary agent (its output_key)
+ITINERARY_DAY_RECORD_KEY = "itinerary_day_record"
+# Each streamed day is then kept under a key of its own, so parallel day calls don't overwrite each other
+ITINERARY_STREAMED_DAY_KEY_PREFIX = "itinerary_streamed_day_"
+
+
+# --- Output schemas (what the recommender agents must return) ---
+
+class FlightOption(BaseModel):
+    airline: str = Field(description="Operating airline name.")
+    origin: str = Field(description="Departure airport or city.")
+    destination: str = Field(description="Arrival airport or city.")
+    departure: Optional[str] = Field(default=None, description="Departure date/time as found in the search results.")
+    arrival: Optional[str] = Field(default=None, description="Arrival date/time as found in the search results.")
+    stops: Optional[int] = Field(default=None, description="Number of stops, 0 for a direct flight.")
+    price: Optional[float] = Field(default=None, description="Total numeric fare for all travelers, without currency symbols.")
+    currency: Optional[str] = Field(default=None, description="Currency code of the price, e.g. USD.")
+    notes: Optional[str] = Field(default=None, description="Short extra details (baggage, flight number, etc.).")
+
+
+class FlightRecommendations(BaseModel):
+    flights: List[FlightOption] = Field(default_factory=list)
+    notes: Optional[str] = Field(default=None, description="Message for the user, e.g. a clarification question or why nothing was found.")
+
+
+class HotelOption(BaseModel):
+    name: str = Field(description="Hotel name.")
+    location: Optional[str] = Field(default=None, description="Area or address of the hotel.")
+    rating: Optional[str] = Field(default=None, description="Star rating or review score as found in the search results.")
+    price_per_night: Optional[float] = Field(default=None, description="Numeric nightly rate, without currency symbols.")
+    total_price: Optional[float] = Field(default=None, description="Numeric price for the whole stay, without currency symbols.")
+    currency: Optional[str] = Field(default=None, description="Currency code of the prices, e.g. USD.")
+    amenities: List[str] = Field(default_factory=list)
+    notes: Optional[str] = Field(default=None)
+
+
+class HotelRecommendations(BaseModel):
+    hotels: List[HotelOption] = Field(default_factory=list)
+    notes: Optional[str] = Field(default=None, description="Message for the user, e.g. a clarification question or why nothing was found.")
+
+
+class ItineraryActivity(BaseModel):
+    time_of_day: Optional[str] = Field(default=None, description="e.g. Morning, Afternoon, Evening, or a clock time.")
+    name: str = Field(description="Attraction or activity name.")
+    notes: Optional[str] = Field(default=None, description="Practical details: opening hours, booking, travel time.")
+    estimated_cost: Optional[float] = Field(default=None, description="Numeric cost for all travelers, without currency symbols.")
+    currency: Optional[str] = Field(default=None, description="Currency code of the estimated cost, e.g. EUR.")
+
+
+class ItineraryDayPlan(BaseModel):
+    day: int = Field(description="Day number, starting at 1.")
+    date: Optional[str] = Field(default=None)
+    title: Optional[str] = Field(default=None, description="Short theme for the day.")
+    activities: List[ItineraryActivity] = Field(default_factory=list)
+
+
+class ItineraryRecommendations(BaseModel):
+    days: List[ItineraryDayPlan] = Field(default_factory=list)
+    notes: Optional[str] = Field(default=None, description="Message for the user, e.g. a clarification question.")
+
+
+class FoodVenue(BaseModel):
+    name: str = Field(description="Name of the restaurant, cafe or food truck.")
+    cuisine: Optional[str] = Field(default=None)
+    location: Optional[str] = Field(default=None, description="Location, ideally relative to an itinerary point.")
+    day: Optional[int] = Field(default=None, description="Itinerary day this venue is suggested for.")
+    notes: Optional[str] = Field(default=None, description="Why it is recommended.")
+    estimated_cost: Optional[float] = Field(default=None, description="Numeric cost of a meal for all travelers, without currency symbols.")
+    currency: Optional[str] = Field(default=None, description="Currency code of the estimated cost, e.g. EUR.")
+
+
+class FoodRecommendations(BaseModel):
+    venues: List[FoodVenue] = Field(default_factory=list)
+    notes: Optional[str] = Field(default=None, description="Message for the user, e.g. a clarification question.")
+
+
+# --- Compact in-memory records (built from the validated dicts kept in session state) ---
+
+@dataclass(frozen=True)
+class Flight:
+    airline: str
+    origin: str
+    destination: str
+    departure: Optional[str] = None
+    arrival: Optional[str] = None
+    stops: Optional[int] = None
+    price: Optional[float] = None
+    currency: Optional[str] = None
+    notes: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class Hotel:
+    name: str
+    location: Optional[str] = None
+    rating: Optional[str] = None
+    price_per_night: Optional[float] = None
+    total_price: Optional[float] = None
+    currency: Optional[str] = None
+    amenities: Tuple[str, ...] = ()
+    notes: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class Activity:
+    name: str
+    time_of_day: Optional[str] = None
+    notes: Optional[str] = None
+    estimated_cost: Optional[float] = None
+    currency: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class ItineraryDay:
+    day: int
+    date: Optional[str] = None
+    title: Optional[str] = None
+    activities: Tuple[Activity, ...] = ()
+
+
+@dataclass(frozen=True)
+class Venue:
+    name: str
+    cuisine: Optional[str] = None
+    location: Optional[str] = None
+    day: Optional[int] = None
+    notes: Optional[str] = None
+    estimated_cost: Optional[float] = None
+    currency: Optional[str] = None
+
+
+def _validated(state: Any, key: str, schema: type) -> Optional[BaseModel]:
+    """Returns the recommender output stored under `key`, re-validated against its schema, or None."""
+    raw = state.get(key) if state is not None else None
+    if not raw:
+        return None
+    try:
+        return schema.model_validate(raw)
+    except Exception as e:
+        print(f"WARNING: Ignoring invalid '{key}' in session state: {e}")
+        return None
+
+
+def flights_from_state(state: Any) -> Tuple[Flight, ...]:
+    result = _validated(state, FLIGHT_RECORDS_KEY, FlightRecommendations)
+    return tuple(Flight(**f.model_dump()) for f in result.flights) if result else ()
+
+
+def hotels_from_state(state: Any) -> Tuple[Hotel, ...]:
+    result = _validated(state, HOTEL_RECORDS_KEY, HotelRecommendations)
+    if not result:
+        return ()
+    return tuple(Hotel(**{**h.model_dump(), "amenities": tuple(h.amenities)}) for h in result.hotels)
+
+
+def itinerary_day_key(day: int) -> str:
+    return f"{ITINERARY_STREAMED_DAY_KEY_PREFIX}{day}"
+
+
+def streamed_itinerary_day_keys(state: Any) -> List[str]:
+    """Returns the state keys holding streamed itinerary days (cleared ones included)."""
+    values = state.to_dict() if hasattr(state, "to_dict") else dict(state or {})
+    return [key for key in values if key.startswith(ITINERARY_STREAMED_DAY_KEY_PREFIX)]
+
+
+def clear_streamed_itinerary_days(state: Any) -> None:
+    """Drops all streamed itinerary days, e.g. when a new trip or a full itinerary replaces them."""
+    for key in streamed_itinerary_day_keys(state):
+        if state.get(key) is not None:
+            state[key] = None
+
+
+def itinerary_from_state(state: Any) -> Tuple[ItineraryDay, ...]:
+    """
+    Returns the itinerary days: those of the full itinerary, with any day streamed since
+    (see itinerary_day_key) replacing the day of the same number.
+    """
+    result = _validated(state, ITINERARY_RECORDS_KEY, ItineraryRecommendations)
+    plans = {d.day: d for d in result.days} if result else {}
+    for key in streamed_itinerary_day_keys(state):
+        plan = _validated(state, key, ItineraryDayPlan)
+        if plan:
+            plans[plan.day] = plan
+    days = (
+        ItineraryDay(
+            day=d.day,
+            date=d.date,
+            title=d.title,
+            activities=tuple(Activity(**a.model_dump()) for a in d.activities),
+        )
+        for d in plans.values()
+    )
+    return tuple(sorted(days, key=lambda d: d.day))
+
+
+def venues_from_state(state: Any) -> Tuple[Venue, ...]:
+    result = _validated(state, FOOD_RECORDS_KEY, FoodRecommendations)
+    return tuple(Venue(**v.model_dump()) for v in result.venues) if result else ()
+
+
+def _cheapest_meal_per_day(priced: List[Tuple[float, Optional[str], Optional[int]]], trip_days: int) -> float:
+    """
+    Sums one meal per trip day: the cheapest venue recommended for that day, or for days without
+    one, the cheapest venue recommended for no particular day (else the cheapest venue overall).
+    """
+    cheapest: Dict[Optional[int], float] = {}
+    for amount, _, day in priced:
+        cheapest[day] = min(amount, cheapest.get(day, amount))
+    fallback = cheapest.get(None, min(cheapest.values()))
+    return sum(cheapest.get(day, fallback) for day in range(1, trip_days + 1))
+
+
+def _estimate(priced: List[Tuple[float, Optional[str], Any]], combine) -> Dict[str, Any]:
+    """
+    Combines priced (amount, currency, ...) tuples of one category with `combine`.
+    Amounts in different currencies (or with an unknown currency next to a known one) are not
+    combined; the category is then reported as missing so the user is asked for it instead.
+    """
+    if not priced:
+        return {"amount": None, "currency": None, "reason": "no priced recommendations"}
+    currencies = {(item[1] or "").upper() for item in priced}
+    if len(currencies) > 1:
+        return {"amount": None, "currency": None, "reason": f"mixed currencies: {', '.join(sorted(c or 'unknown' for c in currencies))}"}
+    return {"amount": combine(priced), "currency": currencies.pop() or None, "reason": None}
+
+
+def estimate_costs_from_state(state: Any) -> Dict[str, Dict[str, Any]]:
+    """
+    Derives per-category cost estimates from the stored recommender records.
+    Flights and Hotels use the cheapest priced option, Itinerary sums the priced activities,
+    and Food counts one meal per trip day at the cheapest venue for that day, since venues are alternatives.
+    The trip length is taken from the itinerary, else from the latest day a venue is recommended for;
+    when neither is known, Food is the cost of a single meal and its "reason" says so.
+    Each category maps to {"amount", "currency", "reason"}; "amount" is None when the category
+    has no priced record or mixes currencies.
+    """
+    flight_prices = [(f.price, f.currency, None) for f in flights_from_state(state) if f.price is not None]
+    hotel_prices = [(h.total_price, h.currency, None) for h in hotels_from_state(state) if h.total_price is not None]
+    activity_costs = [
+        (a.estimated_cost, a.currency, None)
+        for d in itinerary_from_state(state)
+        for a in d.activities
+        if a.estimated_cost is not None
+    ]
+    food_costs = [(v.estimated_cost, v.currency, v.day) for v in venues_from_state(state) if v.estimated_cost is not None]
+    trip_days = len(itinerary_from_state(state)) or max((v.day for v in venues_from_state(state) if v.day), default=0)
+
+    food = _estimate(food_costs, lambda priced: _cheapest_meal_per_day(priced, max(trip_days, 1)))
+    if food["amount"] is not None:
+        food["reason"] = f"one meal per day for {trip_days} days" if trip_days else "cost of one meal; trip length unknown"
+    return {
+        "Flights": _estimate(flight_prices, lambda priced: min(item[0] for item in priced)),
+        "Hotels": _estimate(hotel_prices, lambda priced: min(item[0] for item in priced)),
+        "Itinerary": _estimate(activity_costs, lambda priced: sum(item[0] for item in priced)),
+        "Food": food,
+    }
+
+
+def _money(amount: Optional[float], currency: Optional[str]) -> str:
+    if amount is None:
+        return ""
+    return f"{amount:,.2f} {currency}" if currency else f"{amount:,.2f}" # Unknown currency: don't guess one
+
+
+def render_section_lines(records: Tuple[Any, ...]) -> List[Tuple[str, bool, bool]]:
+    """
+    Turns records into document lines as (text, bold, bullet) tuples.
+    Used by the Google Docs export instead of re-parsing markdown.
+    """
+    lines: List[Tuple[str, bool, bool]] = []
+    for record in records:
+        if isinstance(record, Flight):
+            lines.append((f"{record.airline}: {record.origin} to {record.destination}", True, False))
+            if record.departure:
+                lines.append((f"Departure: {record.departure}", False, True))
+            if record.arrival:
+                lines.append((f"Arrival: {record.arrival}", False, True))
+            if record.stops is not None:
+                lines.append(("Direct" if record.stops == 0 else f"Stops: {record.stops}", False, True))
+            if record.price is not None:
+                lines.append((f"Price: {_money(record.price, record.currency)}", False, True))
+        elif isinstance(record, Hotel):
+            lines.append((record.name, True, False))
+            if record.location:
+                lines.append((f"Location: {record.location}", False, True))
+            if record.rating:
+                lines.append((f"Rating: {record.rating}", False, True))
+            if record.price_per_night is not None:
+                lines.append((f"Per night: {_money(record.price_per_night, record.currency)}", False, True))
+            if record.total_price is not None:
+                lines.append((f"Total: {_money(record.total_price, record.currency)}", False, True))
+            if record.amenities:
+                lines.append((f"Amenities: {', '.join(record.amenities)}", False, True))
+        elif isinstance(record, ItineraryDay):
+            heading = f"Day {record.day}"
+            if record.date:
+                heading += f" ({record.date})"
+            if record.title:
+                heading += f": {record.title}"
+            lines.append((heading, True, False))
+            for activity in record.activities:
+                text = f"{activity.time_of_day}: {activity.name}" if activity.time_of_day else activity.name
+                if activity.estimated_cost is not None:
+                    text += f" ({_money(activity.estimated_cost, activity.currency)})"
+                if activity.notes:
+                    text += f" - {activity.notes}"
+                lines.append((text, False, True))
+            continue
+        elif isinstance(record, Venue):
+            heading = f"{record.name} ({record.cuisine})" if record.cuisine else record.name
+            lines.append((heading, True, False))
+            if record.day is not None:
+                lines.append((f"Day {record.day}", False, True))
+            if record.location:
+                lines.append((f"Location: {record.location}", False, True))
+            if record.estimated_cost is not None:
+                lines.append((f"Estimated cost: {_money(record.estimated_cost, record.currency)}", False, True))
+        else:
+            continue
+        if record.notes:
+            lines.append((f"Notes: {record.notes}", False, True))
+    return lines
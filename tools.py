@@ -1,10 +1,20 @@
 # For Google Sheets
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from google.oauth2.service_account import Credentials # Example for service account
 from googleapiclient.discovery import build
 import os
-from google.adk.tools import FunctionTool
+from google.adk.tools import FunctionTool, ToolContext
 import re # Import regular expressions
+from .prefetch import PREFETCH_TRIP_KEY, make_trip_key, prefetch_cache
+from .records import (
+    clear_streamed_itinerary_days,
+    estimate_costs_from_state,
+    flights_from_state,
+    hotels_from_state,
+    itinerary_from_state,
+    render_section_lines,
+    venues_from_state,
+)
 
 
 SHEETS_SERVICE_ACCOUNT_KEY_PATH = os.getenv("SHEETS_SERVICE_ACCOUNT_KEY_PATH") # Path to your service account JSON
@@ -283,105 +293,64 @@ def export_trip_plan_to_google_sheet(
 
 export_to_google_sheet_tool = FunctionTool(func=export_trip_plan_to_google_sheet)
 
-def _generate_text_requests_with_markdown(text_content: str, start_index: int) -> (list, int): # type: ignore
+def _generate_record_requests(lines: List[Tuple[str, bool, bool]], start_index: int) -> (list, int): # type: ignore
     """
-    Parses text_content for markdown (bold, italics, bullets) and generates Google Docs API requests.
+    Generates Google Docs API requests for pre-rendered record lines (see records.render_section_lines).
+    Each line is a (text, bold, bullet) tuple, so no markdown parsing is needed.
     Returns a list of requests and the new current_index after this content.
     """
     requests = []
     current_doc_index = start_index
 
-    for line_with_ending in text_content.splitlines(keepends=True):
-        line_content = line_with_ending.rstrip('\r\n')
-        has_newline = line_with_ending.endswith(('\n', '\r\n'))
-
-        line_start_index_for_paragraph_styling = current_doc_index
-        is_bullet_line = False
-
-        # Handle bullet points
-        bullet_marker_match = re.match(r"^(\*\s+)", line_content) # Only match lines starting with "* "
-        if bullet_marker_match:
-            is_bullet_line = True
-            # Insert the bullet marker text itself, but don't style it yet
-            # The createParagraphBullets will handle the visual bullet
-            # We just need to insert the text content after the marker
-            content_after_bullet = line_content[len(bullet_marker_match.group(1)):].lstrip()
-            text_to_process_inline = content_after_bullet
-        else:
-            text_to_process_inline = line_content
-
-        # Process inline markdown (bold, italics)
-        # Regex to find **bold** or *italic* or _italic_
-        # It captures the content inside the markdown
-        parts = re.split(r'(\*\*.*?\*\*|\*.*?\*|_.*?_)', text_to_process_inline)
- 
-        for part in parts:
-            if not part:
-                continue
- 
-            is_bold_segment = False
-            is_italic_segment = False
-            actual_text_to_insert = part
- 
-            if part.startswith('**') and part.endswith('**') and len(part) > 4:
-                actual_text_to_insert = part[2:-2]
-                is_bold_segment = True
-            elif (part.startswith('*') and part.endswith('*') and len(part) > 2) or \
-                 (part.startswith('_') and part.endswith('_') and len(part) > 2):
-                actual_text_to_insert = part[1:-1]
-                is_italic_segment = True
- 
-            if actual_text_to_insert:
-                requests.append({'insertText': {'location': {'index': current_doc_index}, 'text': actual_text_to_insert}})
-                # Always apply text style to explicitly set/unset bold and italic for the segment
-                requests.append({'updateTextStyle': {
-                    'range': {'startIndex': current_doc_index, 'endIndex': current_doc_index + len(actual_text_to_insert)},
-                    'textStyle': {
-                        'bold': is_bold_segment,
-                        'italic': is_italic_segment
-                        # Other styles like underline, strikethrough, etc., default to false/unset
-                        # unless explicitly handled.
-                    },
-                    'fields': "bold,italic" # Specify that we are updating bold and italic properties
-                }})
-                current_doc_index += len(actual_text_to_insert)
- 
-        # Add the newline character if the original line had one
-        if has_newline:
-            requests.append({'insertText': {'location': {'index': current_doc_index}, 'text': '\n'}})
-            current_doc_index += 1
-        # If it's a bullet line with no actual text content (e.g., "* "),
-        # and it didn't have a newline from the source (meaning it's the last line of input),
-        # we must insert a newline to make it a paragraph for the bullet style to apply correctly.
-        elif is_bullet_line and not text_to_process_inline and not has_newline:
-            requests.append({'insertText': {'location': {'index': current_doc_index}, 'text': '\n'}})
-            current_doc_index += 1
- 
-        # Apply bullet paragraph style if it was a bullet line.
-        # current_doc_index is now at the end of the paragraph (after its newline, if any).
-        # line_start_index_for_paragraph_styling is at the beginning of the paragraph's text content.
-        if is_bullet_line:
-            if current_doc_index > line_start_index_for_paragraph_styling: # Ensure the paragraph has content
-                requests.append({'createParagraphBullets': {
-                    'range': {
-                        'startIndex': line_start_index_for_paragraph_styling,
-                        'endIndex': current_doc_index # This range includes the paragraph's own newline
-                    },
-                    'bulletPreset': 'BULLET_DISC_CIRCLE_SQUARE' # Or other presets
-                }})
+    for text, is_bold, is_bullet in lines:
+        paragraph_text = f"{text}\n"
+        requests.append({'insertText': {'location': {'index': current_doc_index}, 'text': paragraph_text}})
+        # Always set the paragraph and text style explicitly so they don't bleed over from an adjacent heading
+        requests.append({'updateParagraphStyle': {
+            'range': {'startIndex': current_doc_index, 'endIndex': current_doc_index + len(text)},
+            'paragraphStyle': {'namedStyleType': 'NORMAL_TEXT'},
+            'fields': 'namedStyleType'
+        }})
+        requests.append({'updateTextStyle': {
+            'range': {'startIndex': current_doc_index, 'endIndex': current_doc_index + len(text)},
+            'textStyle': {'bold': is_bold, 'italic': False},
+            'fields': "bold,italic"
+        }})
+        if is_bullet:
+            requests.append({'createParagraphBullets': {
+                'range': {
+                    'startIndex': current_doc_index,
+                    'endIndex': current_doc_index + len(paragraph_text) # This range includes the paragraph's own newline
+                },
+                'bulletPreset': 'BULLET_DISC_CIRCLE_SQUARE'
+            }})
+        current_doc_index += len(paragraph_text)
     return requests, current_doc_index
 
 def export_trip_plan_to_google_doc(
-    flight_data: str,
-    hotel_data: str,
-    itinerary_data: str,
-    food_recommendations_data: Optional[str] = None, # New parameter for food recommendations
-    document_title: Optional[str] = "Travel Plan Document"
+    tool_context: ToolContext,
+    document_title: Optional[str] = "Travel Plan Document",
+    include_itinerary: bool = True
 ) -> Dict[str, Any]:
     """
-    Exports flight, hotel, and itinerary data to a new Google Doc,
-    with each section under a respective heading.
+    Exports the flight, hotel, itinerary and (if available) food records gathered by the
+    recommender agents in this session to a new Google Doc, with each section under a respective heading.
+    With include_itinerary=False the Itinerary heading is written without content, so a streamed
+    itinerary can be added to it day by day with append_itinerary_day_to_google_doc.
     """
+    state = tool_context.state
+    sections = [
+        ("Flights", flights_from_state(state)),
+        ("Hotels", hotels_from_state(state)),
+        ("Itinerary", itinerary_from_state(state) if include_itinerary else ()),
+    ]
+    # Add food recommendations section if any were gathered
+    venues = venues_from_state(state)
+    if venues:
+        sections.append(("Food", venues))
+    if include_itinerary and not any(records for _, records in sections):
+        return {"status": "error", "message": "No flight, hotel, itinerary or food recommendations found in this session to export."}
+
     services = _get_sheets_service() # Reusing this helper, it now returns docs_service too
     if not services or not all(services):
         return {"status": "error", "message": "Google API services (Sheets, Drive, or Docs) not available."}
@@ -417,16 +386,7 @@ def export_trip_plan_to_google_doc(
         requests = []
         current_index = 1 # Start inserting at the beginning of the document body
 
-        sections = [
-            ("Flights", flight_data),
-            ("Hotels", hotel_data),
-            ("Itinerary", itinerary_data),
-        ]
-        # Add food recommendations section if data is provided
-        if food_recommendations_data:
-            sections.append(("Food", food_recommendations_data))
-
-        for title, data_content in sections:
+        for title, records in sections:
             # Insert heading text
             heading_text = f"{title}\n"
             requests.append({
@@ -461,16 +421,10 @@ def export_trip_plan_to_google_doc(
             })
             current_index += len(heading_text)
 
-         # Generate requests for data content with bolding
-            data_requests, new_current_index = _generate_text_requests_with_markdown(data_content, current_index)
+            # Generate requests for the section's records
+            data_requests, new_current_index = _generate_record_requests(render_section_lines(records), current_index)
             requests.extend(data_requests)
             current_index = new_current_index
-            
-            # Add a single newline for spacing after the section's data, if the data_content itself doesn't end with one.
-            # The _generate_text_requests_with_markdown should handle newlines from data_content.
-            if data_content and not data_content.endswith('\n'):
-                requests.append({'insertText': {'location': {'index': current_index}, 'text': "\n"}})
-                current_index += 1
         docs_service.documents().batchUpdate(documentId=doc_id, body={'requests': requests}).execute()
         print(f"INFO: Content written to Google Doc {doc_id}")
 
@@ -491,6 +445,85 @@ def export_trip_plan_to_google_doc(
 export_to_google_doc_tool = FunctionTool(func=export_trip_plan_to_google_doc)
 
 
+def _itinerary_section_end_index(content: list) -> int:
+    """
+    Returns the index just before the heading that follows the "Itinerary" heading, i.e. the end
+    of the Itinerary section. Falls back to the end of the document when there is no later heading.
+    """
+    in_itinerary_section = False
+    for element in content:
+        paragraph = element.get('paragraph')
+        if not paragraph or paragraph.get('paragraphStyle', {}).get('namedStyleType') != 'HEADING_1':
+            continue
+        heading_text = "".join(e.get('textRun', {}).get('content', "") for e in paragraph.get('elements', [])).strip()
+        if in_itinerary_section:
+            return element['startIndex']
+        in_itinerary_section = heading_text == "Itinerary"
+    # The body always ends with a final newline that cannot be written past, so insert just before it
+    return content[-1].get('endIndex', 2) - 1 if content else 1
+
+
+def append_itinerary_day_to_google_doc(
+    document_id: str,
+    day: int,
+    tool_context: ToolContext
+) -> Dict[str, Any]:
+    """
+    Appends a single itinerary day, as produced by the streaming itinerary agent in this session,
+    to the end of the "Itinerary" section of an existing Google Doc (or the end of the document if it
+    has no such section). Used to grow the itinerary section day by day instead of waiting for the
+    whole itinerary before exporting.
+    """
+    day_record = next((d for d in itinerary_from_state(tool_context.state) if d.day == day), None)
+    if not day_record:
+        return {"status": "error", "message": f"Day {day} of the itinerary has not been generated in this session yet."}
+
+    services = _get_sheets_service() # Reusing this helper
+    if not services or not all(services):
+        return {"status": "error", "message": "Google API services (Sheets, Drive, or Docs) not available."}
+    _, _, docs_service = services # We only need docs_service here
+
+    try:
+        doc = docs_service.documents().get(
+            documentId=document_id,
+            fields="body(content(startIndex,endIndex,paragraph(paragraphStyle(namedStyleType),elements(textRun(content)))))"
+        ).execute()
+        insert_index = _itinerary_section_end_index(doc.get('body', {}).get('content', []))
+
+        requests, _ = _generate_record_requests(render_section_lines((day_record,)), insert_index)
+        docs_service.documents().batchUpdate(documentId=document_id, body={'requests': requests}).execute()
+        print(f"INFO: Appended itinerary day {day} to Google Doc {document_id}")
+        return {
+            "status": "success",
+            "message": f"Day {day} appended to the Google Doc.",
+            "document_url": f"https://docs.google.com/document/d/{document_id}/edit",
+            "document_id": document_id
+        }
+    except Exception as e:
+        print(f"ERROR: Failed to append itinerary day {day} to Google Doc '{document_id}': {str(e)}")
+        return {"status": "error", "message": f"Failed to append day {day} to Google Doc: {str(e)}", "document_id": document_id}
+
+append_itinerary_day_to_google_doc_tool = FunctionTool(func=append_itinerary_day_to_google_doc)
+
+
+def get_trip_cost_estimates(tool_context: ToolContext) -> Dict[str, Any]:
+    """
+    Returns cost estimates for "Flights", "Hotels", "Itinerary" and "Food" taken from the
+    recommendations already gathered in this session, each as {"amount", "currency", "reason"}.
+    An amount of None means no usable priced recommendation exists for that category (see "reason")
+    and the user has to be asked for it. For Food, "reason" also states what the amount covers.
+    """
+    estimates = estimate_costs_from_state(tool_context.state)
+    missing = [category for category, estimate in estimates.items() if estimate["amount"] is None]
+    return {
+        "status": "success",
+        "estimates": estimates,
+        "missing_categories": missing
+    }
+
+get_trip_cost_estimates_tool = FunctionTool(func=get_trip_cost_estimates)
+
+
 def delete_google_file_by_id(file_id: str) -> Dict[str, Any]:
     """
     Deletes a file (like a Google Sheet or Google Doc) from Google Drive
@@ -513,4 +546,41 @@ def delete_google_file_by_id(file_id: str) -> Dict[str, Any]:
         print(f"ERROR: Failed to delete file with ID '{file_id}': {str(e)}")
         return {"status": "error", "message": f"Failed to delete file with ID '{file_id}': {str(e)}"}
 
-delete_google_file_tool = FunctionTool(func=delete_google_file_by_id)
\ No newline at end of file
+delete_google_file_tool = FunctionTool(func=delete_google_file_by_id)
+
+
+async def start_trip_prefetch(
+    destination: str,
+    start_date: str,
+    end_date: str,
+    tool_context: ToolContext
+) -> Dict[str, Any]:
+    """
+    Starts background searches for hotels, attractions and restaurants at the destination for the
+    given dates, so the hotel, itinerary and food recommenders can use the results without searching
+    from scratch. Returns immediately; the searches keep running in the background.
+    A new destination or new dates also drop the itinerary days streamed for the previous trip.
+    """
+    trip_key = make_trip_key(destination, start_date, end_date)
+    if (tool_context.state.get(PREFETCH_TRIP_KEY) or {}).get("trip_key") != trip_key:
+        clear_streamed_itinerary_days(tool_context.state)
+
+    model = os.getenv("PREFETCH_MODEL_ID") or os.getenv("FAST_MODEL_ID") or os.getenv("MODEL_ID")
+    if not model:
+        return {"status": "error", "message": "No model configured for prefetching (set PREFETCH_MODEL_ID or MODEL_ID)."}
+
+    try:
+        started = prefetch_cache.start(tool_context.session.id, trip_key, model, destination, start_date, end_date)
+    except Exception as e:
+        print(f"ERROR: Failed to start prefetch searches for {destination}: {str(e)}")
+        return {"status": "error", "message": f"Failed to start background searches: {str(e)}"}
+    # Lets the sub-agents, which run in sessions of their own, find this session's results
+    tool_context.state[PREFETCH_TRIP_KEY] = {"session_id": tool_context.session.id, "trip_key": trip_key, "destination": destination}
+    print(f"INFO: Started {started} prefetch searches for {destination} ({start_date} to {end_date}). Stats: {prefetch_cache.stats()}")
+    return {
+        "status": "success",
+        "message": f"Background searches for {destination} are running." if started else f"Background searches for {destination} were already started."
+    }
+
+start_trip_prefetch_tool = FunctionTool(func=start_trip_prefetch)
+